@@ -1,14 +1,16 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
+import numpy as np
 from datetime import datetime, time, date
-import time as time_sleep
 import os
 import hashlib
+import hmac
 import pytz
-
-# --- AI Integration Imports ---
-from transformers import pipeline
+import threading
+import queue
+from contextlib import contextmanager
+from streamlit_autorefresh import st_autorefresh
 
 # --- App Configuration ---
 st.set_page_config(page_title="AI-Powered Timesheet Tool", layout="wide")
@@ -18,27 +20,109 @@ IST = pytz.timezone('Asia/Kolkata')
 
 # --- Database Setup ---
 DB_FILE = "company_data.db"
-LAST_UPDATE_FILE = "last_update.txt"
 ADMIN_PASSWORD = "admin"
+PBKDF2_ITERATIONS = 200_000
+# Checked against for unknown employee IDs so they cost the same PBKDF2 run as known ones
+DUMMY_PASSWORD_SALT = bytes(16)
+DUMMY_PASSWORD_HASH = "0" * 64
+READER_POOL_SIZE = 4
+
+# --- SQL Statements ---
+# Runtime query statements, each defined once; schema DDL and migrations stay in
+# initialize_database().
+SQL_INSERT_EMPLOYEE = "INSERT INTO employees (employee_id, name, password, salt) VALUES (?, ?, ?, ?)"
+SQL_SELECT_EMPLOYEES = "SELECT employee_id, name FROM employees"
+SQL_SELECT_CREDENTIALS = "SELECT employee_id, password, salt FROM employees"
+SQL_SELECT_PROJECT_NAMES = "SELECT DISTINCT project_name FROM timesheet"
+SQL_INSERT_TIMESHEET = """
+    INSERT INTO timesheet (employee_id, project_name, task_description, hours_worked, submission_date, submission_time)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# One row per timesheet entry on the date, plus one empty row per employee with no
+# entries; first_time is each employee's earliest submission that day.
+SQL_SELECT_DAY_FOR_DASHBOARD = """
+    SELECT e.id AS employee_rowid, e.employee_id, e.name, t.project_name, t.task_description,
+           t.hours_worked, t.submission_date, t.submission_time,
+           MIN(t.submission_time) OVER (PARTITION BY e.employee_id) AS first_time
+    FROM employees e
+    LEFT JOIN timesheet t ON t.employee_id = e.employee_id AND t.submission_date = ?
+    ORDER BY t.submission_time DESC
+"""
+SQL_UPSERT_META = "INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)"
+SQL_SELECT_META = "SELECT v FROM meta WHERE k = ?"
 
-def hash_password(password):
+def prehash_password(password):
+    """Unsalted SHA-256 hex digest; this was the stored format before salts were added."""
     return hashlib.sha256(password.encode()).hexdigest()
 
-def get_db_connection():
+def derive_password_hash(password_digest, salt):
+    return hashlib.pbkdf2_hmac("sha256", password_digest.encode(), salt, PBKDF2_ITERATIONS).hex()
+
+def hash_password(password, salt):
+    return derive_password_hash(prehash_password(password), salt)
+
+def _open_connection():
     conn = sqlite3.connect(DB_FILE, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # Per-connection tuning; journal_mode=WAL is persisted by initialize_database()
+    conn.executescript("""
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-64000;
+        PRAGMA mmap_size=268435456;
+    """)
     return conn
 
+@st.cache_resource
+def get_db_connection():
+    """Opens the process-wide write connection shared by every session and rerun."""
+    return _open_connection()
+
+@st.cache_resource
+def get_db_write_lock():
+    """Serializes transactions on the shared write connection across session threads."""
+    return threading.Lock()
+
+@st.cache_resource
+def get_reader_pool():
+    """Read-only connections, so reads never see another session's open transaction."""
+    pool = queue.Queue()
+    for _ in range(READER_POOL_SIZE):
+        conn = _open_connection()
+        conn.execute("PRAGMA query_only=TRUE")
+        pool.put(conn)
+    return pool
+
+@contextmanager
+def read_connection():
+    """Borrows a reader connection from the pool for the duration of the block."""
+    pool = get_reader_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+@st.cache_resource
 def initialize_database():
+    """Creates the schema and switches the DB file to WAL once per process."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS employees (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT UNIQUE NOT NULL, name TEXT NOT NULL, password TEXT NOT NULL
+            employee_id TEXT UNIQUE NOT NULL, name TEXT NOT NULL, password TEXT NOT NULL,
+            salt BLOB
         )
     """)
-    cursor.execute("""
+    if "salt" not in {row["name"] for row in conn.execute("PRAGMA table_info(employees)")}:
+        conn.execute("ALTER TABLE employees ADD COLUMN salt BLOB")
+    # Legacy rows store the SHA-256 pre-hash, so they can be upgraded to PBKDF2 without the plaintext
+    for row in conn.execute("SELECT employee_id, password FROM employees WHERE salt IS NULL").fetchall():
+        salt = os.urandom(16)
+        conn.execute("UPDATE employees SET password = ?, salt = ? WHERE employee_id = ?",
+                     (derive_password_hash(row["password"], salt), salt, row["employee_id"]))
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS timesheet (
             id INTEGER PRIMARY KEY AUTOINCREMENT, employee_id TEXT NOT NULL,
             project_name TEXT NOT NULL, task_description TEXT NOT NULL,
@@ -47,109 +131,159 @@ def initialize_database():
             FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
         )
     """)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ts_date_emp ON timesheet (submission_date, employee_id, submission_time)")
+    conn.execute("ANALYZE")
     conn.commit()
-    conn.close()
 
 # --- AI Model Loading ---
 @st.cache_resource
-def get_classification_pipeline():
-    """Loads and caches the AI model pipeline."""
-    return pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+def get_text_encoder():
+    """Loads and caches the sentence encoder, with its Linear layers quantized to int8."""
+    # Imported lazily: torch takes seconds to load and only the suggestion button needs it
+    import torch
+    from sentence_transformers import SentenceTransformer
+    encoder = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+    return torch.ao.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _project_embeddings(projects):
+    """Unit-length project name vectors, recomputed only when the project set changes."""
+    return get_text_encoder().encode(list(projects), normalize_embeddings=True)
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _classify_task(task_description, projects):
+    task_vector = get_text_encoder().encode([task_description], normalize_embeddings=True)
+    # Cosine similarity, since both sides are normalized
+    scores = task_vector @ _project_embeddings(projects).T
+    return projects[int(np.argmax(scores))]
 
 def suggest_project_name(task_description, project_list):
     """Uses AI to suggest a project name based on the task description."""
     if not task_description or not project_list:
         return None
-    classifier = get_classification_pipeline()
-    result = classifier(task_description, candidate_labels=project_list)
-    return result['labels'][0]
+    # Sorted tuple so any ordering of the same projects hits one cache entry
+    return _classify_task(task_description, tuple(sorted(project_list)))
 
 # --- Employee Management (Admin) ---
 def add_employee(employee_id, name, password):
     conn = get_db_connection()
-    cursor = conn.cursor()
+    # Derive the hash before taking the write lock so PBKDF2 doesn't stall other writers
+    salt = os.urandom(16)
+    password_hash = hash_password(password, salt)
     try:
-        cursor.execute("INSERT INTO employees (employee_id, name, password) VALUES (?, ?, ?)",
-                       (employee_id, name, hash_password(password)))
-        conn.commit()
+        with get_db_write_lock(), conn:
+            conn.execute(SQL_INSERT_EMPLOYEE, (employee_id, name, password_hash, salt))
+            mark_data_updated(conn, employees_changed=True)
         st.success(f"Employee {name} ({employee_id}) added successfully.")
     except sqlite3.IntegrityError:
         st.error(f"Employee ID {employee_id} already exists.")
-    finally:
-        conn.close()
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=2)
+def _load_all_employees(version):
+    with read_connection() as conn:
+        rows = conn.execute(SQL_SELECT_EMPLOYEES).fetchall()
+    return pd.DataFrame.from_records([tuple(row) for row in rows], columns=["employee_id", "name"])
 
 def get_all_employees():
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT employee_id, name FROM employees", conn)
-    conn.close()
-    return df
+    return _load_all_employees(get_employees_version())
 
 # --- Timesheet and Attendance Logic ---
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=2)
+def _load_unique_project_names(version):
+    with read_connection() as conn:
+        return [row[0] for row in conn.execute(SQL_SELECT_PROJECT_NAMES)]
+
 def get_unique_project_names():
     """Gets a list of unique project names for AI suggestions."""
+    return _load_unique_project_names(get_last_update_time())
+
+def add_timesheet_entries(entries):
+    """Inserts (employee_id, project_name, task_description, hours_worked, entry_date) rows in one transaction."""
+    if not entries:
+        return
     conn = get_db_connection()
-    try:
-        df = pd.read_sql_query("SELECT DISTINCT project_name FROM timesheet", conn)
-        return df['project_name'].tolist()
-    finally:
-        conn.close()
+    submission_time = datetime.now(IST).strftime("%H:%M:%S")
+    with get_db_write_lock(), conn:
+        conn.executemany(SQL_INSERT_TIMESHEET, [(*entry, submission_time) for entry in entries])
+        mark_data_updated(conn)
 
 def add_timesheet_entry(employee_id, project_name, task_description, hours_worked, entry_date):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    now = datetime.now(IST)
-    cursor.execute("""
-        INSERT INTO timesheet (employee_id, project_name, task_description, hours_worked, submission_date, submission_time)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (employee_id, project_name, task_description, hours_worked, entry_date, now.strftime("%H:%M:%S")))
-    conn.commit()
-    conn.close()
-    with open(LAST_UPDATE_FILE, "w") as f:
-        f.write(str(now.timestamp()))
+    add_timesheet_entries([(employee_id, project_name, task_description, hours_worked, entry_date)])
 
-def get_timesheet_entries_today():
-    conn = get_db_connection()
-    today = datetime.now(IST).date()
-    query = "SELECT t.employee_id, e.name, t.project_name, t.task_description, t.hours_worked, t.submission_date, t.submission_time FROM timesheet t JOIN employees e ON t.employee_id = e.employee_id WHERE t.submission_date = ? ORDER BY t.submission_time DESC"
-    df = pd.read_sql_query(query, conn, params=(str(today),))
-    conn.close()
-    return df
-
-def get_attendance_status():
-    employees_df = get_all_employees()
-    if employees_df.empty:
-        return pd.DataFrame(columns=["Employee ID", "Name", "Status"])
-    timesheet_today_df = get_timesheet_entries_today()
-    status_list = []
-    for _, employee in employees_df.iterrows():
-        emp_id = employee["employee_id"]
-        emp_name = employee["name"]
-        emp_entries = timesheet_today_df[timesheet_today_df['employee_id'] == emp_id]
-        status = "Absent"
-        if not emp_entries.empty:
-            first_entry_time = datetime.strptime(emp_entries['submission_time'].min(), '%H:%M:%S').time()
-            if time(8, 30) <= first_entry_time <= time(10, 0): status = "Present"
-            elif first_entry_time >= time(13, 0): status = "Half-day"
-            else: status = "Present (Late)"
-        status_list.append({"Employee ID": emp_id, "Name": emp_name, "Status": status})
-    return pd.DataFrame(status_list)
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=2)
+def _load_day_overview(day, version):
+    """Fetches a day's timesheet rows and attendance in a single query."""
+    with read_connection() as conn:
+        df = pd.read_sql_query(SQL_SELECT_DAY_FOR_DASHBOARD, conn, params=(day,))
+    timesheet_df = df[df['submission_time'].notna()].drop(columns=["employee_rowid", "first_time"])
+
+    attendance_df = df.drop_duplicates('employee_id').sort_values('employee_rowid')
+    # submission_time is zero-padded HH:MM:SS, so string order matches time order
+    first_time = attendance_df['first_time']
+    conditions = [
+        first_time.isna(),
+        first_time.between("08:30:00", "10:00:00"),
+        first_time.ge("13:00:00"),
+    ]
+    attendance_df = pd.DataFrame({
+        "Employee ID": attendance_df['employee_id'],
+        "Name": attendance_df['name'],
+        "Status": np.select(conditions, ["Absent", "Present", "Half-day"], default="Present (Late)"),
+    })
+    return attendance_df.reset_index(drop=True), timesheet_df.reset_index(drop=True)
+
+def get_today_overview():
+    """Returns (attendance status, timesheet entries) for today."""
+    fingerprint = (str(datetime.now(IST).date()), get_last_update_time())
+    # Reuse this session's frames while nothing changed; a st.cache_data hit
+    # still unpickles fresh copies of both tables on every dashboard refresh.
+    previous = st.session_state.get("today_overview")
+    if previous is not None and previous[0] == fingerprint:
+        return previous[1]
+    overview = _load_day_overview(*fingerprint)
+    st.session_state.today_overview = (fingerprint, overview)
+    return overview
 
 # --- Real-time Update Mechanism ---
+# The timestamps double as the cache keys for the _load_* readers above.
+# employees_version only moves on employee changes, so logins stay cached across timesheet inserts.
+def mark_data_updated(conn, employees_changed=False):
+    """Bumps the change markers; call inside the writer's transaction so they commit with the data."""
+    now = datetime.now(IST).timestamp()
+    conn.execute(SQL_UPSERT_META, ("last_update", now))
+    if employees_changed:
+        conn.execute(SQL_UPSERT_META, ("employees_version", now))
+
+def _get_meta_value(key):
+    with read_connection() as conn:
+        result = conn.execute(SQL_SELECT_META, (key,)).fetchone()
+    return result['v'] if result else 0.0
+
 def get_last_update_time():
-    if os.path.exists(LAST_UPDATE_FILE):
-        with open(LAST_UPDATE_FILE, "r") as f:
-            try: return float(f.read().strip())
-            except (ValueError, TypeError): return 0.0
-    return 0.0
+    return _get_meta_value("last_update")
+
+def get_employees_version():
+    return _get_meta_value("employees_version")
 
 # --- Authentication ---
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_employee_credentials(version):
+    """Read-only {employee_id: (password_hash, salt)} snapshot, shared across sessions without copying."""
+    with read_connection() as conn:
+        return {row['employee_id']: (row['password'], row['salt'])
+                for row in conn.execute(SQL_SELECT_CREDENTIALS)}
+
+@st.cache_data(show_spinner=False, max_entries=2048)
+def _verify_credentials(employee_id, password_digest, version):
+    stored = _load_employee_credentials(version).get(employee_id)
+    password_hash, salt = stored if stored is not None else (DUMMY_PASSWORD_HASH, DUMMY_PASSWORD_SALT)
+    matches = hmac.compare_digest(password_hash, derive_password_hash(password_digest, salt))
+    return stored is not None and matches
+
 def check_employee_credentials(employee_id, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT password FROM employees WHERE employee_id = ?", (employee_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result and result['password'] == hash_password(password)
+    # Keyed on the pre-hash so plaintext never enters the cache; reruns skip the PBKDF2 work
+    return _verify_credentials(employee_id, prehash_password(password), get_employees_version())
 
 # --- Streamlit UI Views ---
 def login_page():
@@ -225,24 +359,15 @@ def admin_view():
     st.dataframe(get_all_employees(), use_container_width=True)
 
 def manager_dashboard():
+    # Reruns the script every 2s; the cached readers make unchanged reruns cheap
+    st_autorefresh(interval=2000, key="dashboard_refresh")
+    attendance_df, timesheet_df = get_today_overview()
     st.header("Admin Dashboard")
     st.subheader("Today's Attendance Status")
-    
-    attendance_placeholder = st.empty()
-    attendance_placeholder.dataframe(get_attendance_status(), use_container_width=True)
+    st.dataframe(attendance_df, use_container_width=True)
 
     st.subheader("Today's Timesheet Entries")
-    timesheet_placeholder = st.empty()
-    timesheet_placeholder.dataframe(get_timesheet_entries_today(), use_container_width=True)
-
-    # Real-time update loop
-    while True:
-        last_update_time = get_last_update_time()
-        if 'last_update_check' not in st.session_state or last_update_time > st.session_state.last_update_check:
-            st.session_state.last_update_check = last_update_time
-            attendance_placeholder.dataframe(get_attendance_status(), use_container_width=True)
-            timesheet_placeholder.dataframe(get_timesheet_entries_today(), use_container_width=True)
-        time_sleep.sleep(2)
+    st.dataframe(timesheet_df, use_container_width=True)
 
 def main():
     initialize_database()